@@ -1,14 +1,102 @@
 from flask import Flask, render_template, send_from_directory, send_file, request, Response
+from werkzeug.utils import safe_join
 import os
 import socket
 import mimetypes
+import stat
 import subprocess
+import functools
+import hashlib
+import logging
+import time
+import urllib.parse
 
 BASE_DIR = "D:\\TV"
-VIDEO_EXTS = ['.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.ts', '.webm', '.m2ts']
+VIDEO_EXTS = frozenset({'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.ts', '.webm', '.m2ts'})
+# Adding index.jpg to a subfolder doesn't change the parent's mtime, so cached
+# listings are also refreshed after this many seconds
+LISTING_CACHE_TTL = 60
+THUMB_MAX_AGE = 86400  # seconds browsers may reuse a thumbnail without revalidating
+# Hand raw file transfers to a front-end server instead of reading them in Python.
+# nginx: set to an internal location aliased to BASE_DIR, e.g. '/_internal/' with
+#   location /_internal/ { internal; alias D:/TV/; }
+X_ACCEL_PREFIX = None
+FFMPEG_PATH = 'C:\\ffmpeg-2025-11-17-git-e94439e49b-full_build\\bin\\ffmpeg.exe'
+# Video encoder options for /stream, tried in order. Hardware encoders (NVIDIA, Intel, AMD)
+# are only used if a test encode succeeds; libx264 is the software fallback.
+STREAM_ENCODERS = [
+    ('h264_nvenc', ['-preset', 'p4', '-tune', 'll', '-rc', 'vbr']),
+    ('h264_qsv', ['-preset', 'faster']),
+    ('h264_amf', ['-usage', 'lowlatency', '-quality', 'balanced']),
+    # 'faster' gives much better quality per bit than 'ultrafast' for a modest CPU cost.
+    # Fixed 2s GOP (at 30fps) without scene cuts so frag_keyframe produces evenly sized fragments
+    ('libx264', ['-preset', 'faster', '-threads', '0', '-x264-params', 'keyint=60:min-keyint=60:scenecut=0']),
+]
+
+# Per-request debug logging is off by default; lower the level to trace thumbnail lookups
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
 
 # Skeleton stripped down version: template_folder='templates'
 app = Flask(__name__, template_folder='templates/ux')
+# Apache (mod_xsendfile): Flask's send_file emits X-Sendfile when this is on
+app.config['USE_X_SENDFILE'] = False
+
+def _send_media(full_path, relpath, mime_type):
+    """Send a file under BASE_DIR, via X-Accel-Redirect when nginx is in front."""
+    if X_ACCEL_PREFIX:
+        response = Response(status=200, mimetype=mime_type)
+        response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX + urllib.parse.quote(relpath)
+        return response
+    return send_file(full_path, mimetype=mime_type)
+
+@functools.lru_cache(maxsize=None)
+def _stream_video_args():
+    """Pick the first STREAM_ENCODERS entry ffmpeg can actually use (probed once)."""
+    for encoder, options in STREAM_ENCODERS[:-1]:
+        probe = [FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1',
+                 '-frames:v', '1', '-c:v', encoder, '-f', 'null', '-']
+        try:
+            if subprocess.run(probe, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15).returncode == 0:
+                return encoder, ['-c:v', encoder] + options
+        except subprocess.TimeoutExpired:
+            continue  # this encoder hung; the others may still work
+        except OSError:
+            break  # ffmpeg itself can't be run
+    encoder, options = STREAM_ENCODERS[-1]
+    return encoder, ['-c:v', encoder] + options
+
+def _is_video(name):
+    """True if name has a video extension (only the extension is lower-cased)."""
+    i = name.rfind('.')
+    return i != -1 and name[i:].lower() in VIDEO_EXTS
+
+def _stat_or_none(path):
+    """Stat path once, returning None if it can't be accessed or safe_join rejected it."""
+    if path is None:
+        return None
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+@functools.lru_cache(maxsize=1024)
+def _scandir_cached(path, mtime_ns, ttl_bucket):
+    """List a directory once per (mtime, TTL window): returns (dirs, files, dirs_with_thumb)."""
+    dirs, files, thumb_dirs = [], [], set()
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                dirs.append(entry.name)
+                # One stat on the candidate file rather than listing the subfolder
+                try:
+                    os.stat(entry.path + os.sep + 'index.jpg')
+                except OSError:
+                    continue
+                thumb_dirs.add(entry.name)
+            elif entry.is_file():
+                files.append(entry.name)
+    return tuple(sorted(dirs)), tuple(sorted(files)), frozenset(thumb_dirs)
 
 @app.route('/')
 def index():
@@ -16,51 +104,59 @@ def index():
 
 @app.route('/browse/<path:subpath>')
 def browse(subpath):
-    full_path = os.path.join(BASE_DIR, subpath)
-    if not os.path.exists(full_path):
+    full_path = safe_join(BASE_DIR, subpath)
+    st = _stat_or_none(full_path)
+    if st is None:
         return "Path not found", 404
 
-    if os.path.isfile(full_path):
+    if stat.S_ISREG(st.st_mode):
         # If it's a file, serve it
         is_mobile = 'mobile' in request.headers.get('User-Agent', '').lower()
         mime_type = mimetypes.guess_type(full_path)[0] or 'video/mp4'
         # For mobile, keep proper MIME so app can stream
-        return send_file(full_path, mimetype=mime_type)
+        return _send_media(full_path, subpath, mime_type)
 
-    items = os.listdir(full_path)
-    dirs = sorted([item for item in items if os.path.isdir(os.path.join(full_path, item))])
-    files = sorted([item for item in items if os.path.isfile(os.path.join(full_path, item))])
+    dirs, files, thumb_dirs = _scandir_cached(full_path, st.st_mtime_ns, int(time.time() // LISTING_CACHE_TTL))
     videos = []
-    for f in sorted([f for f in files if any(f.lower().endswith(ext) for ext in VIDEO_EXTS)]):
-        video_href = "/browse/" + ((subpath + "/" + f) if subpath else f)
-        videos.append({'name': f, 'href': video_href})
-    other_files = sorted([f for f in files if not any(f.lower().endswith(ext) for ext in VIDEO_EXTS)])
+    other_files = []
+    for f in files:
+        if _is_video(f):
+            video_href = "/browse/" + ((subpath + "/" + f) if subpath else f)
+            videos.append({'name': f, 'href': video_href})
+        else:
+            other_files.append(f)
 
     parent_path = '/'.join(subpath.split('/')[:-1]) if '/' in subpath else ''
     is_mobile = 'mobile' in request.headers.get('User-Agent', '').lower()
     # For intent URL on mobile
     host = request.host
+
+    # The page only changes with the listing and the request details it renders,
+    # so let the browser revalidate with an ETag instead of re-rendering
+    # The template's mtime is included so edits to it (debug mode reloads templates) aren't hidden by 304s
+    template_st = _stat_or_none(os.path.join(app.root_path, app.template_folder, 'index.html'))
+    template_version = template_st.st_mtime_ns if template_st else None
+    etag = hashlib.md5(repr((dirs, files, sorted(thumb_dirs), subpath, is_mobile, host, app.template_folder, template_version)).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
     # Check for thumbnails if using UX template
     if 'ux' in app.template_folder.lower():
-        dirs_processed = []
-        for d in dirs:
-            folder_path = os.path.join(BASE_DIR, subpath, d) if subpath else os.path.join(BASE_DIR, d)
-            has_thumb = False
-            try:
-                if os.path.exists(folder_path):
-                    files = os.listdir(folder_path)
-                    has_thumb = any(f.lower() == 'index.jpg' for f in files)
-            except Exception as e:
-                print(f"Error checking thumb for {d}: {e}")
-            dirs_processed.append({'name': d, 'has_thumb': has_thumb})
+        dirs_processed = [{'name': d, 'has_thumb': d in thumb_dirs} for d in dirs]
     else:
         dirs_processed = dirs
-    return render_template('index.html', dirs=dirs_processed, videos=videos, other_files=other_files, subpath=subpath, parent_path=parent_path, is_mobile=is_mobile, host=host)
+    response = Response(render_template('index.html', dirs=dirs_processed, videos=videos, other_files=other_files, subpath=subpath, parent_path=parent_path, is_mobile=is_mobile, host=host))
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/play/<path:filepath>')
 def play(filepath):
-    full_path = os.path.join(BASE_DIR, filepath)
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
+    full_path = safe_join(BASE_DIR, filepath)
+    st = _stat_or_none(full_path)
+    if st is None or not stat.S_ISREG(st.st_mode):
         return "Video not found", 404
 
     filename = os.path.basename(full_path)
@@ -69,53 +165,60 @@ def play(filepath):
 
 @app.route('/video/<path:filepath>')
 def video(filepath):
-    full_path = os.path.join(BASE_DIR, filepath)
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
+    full_path = safe_join(BASE_DIR, filepath)
+    st = _stat_or_none(full_path)
+    if st is None or not stat.S_ISREG(st.st_mode):
         return "File not found", 404
 
     mime_type = mimetypes.guess_type(full_path)[0] or 'video/mp4'
-    return send_file(full_path, mimetype=mime_type)
+    return _send_media(full_path, filepath, mime_type)
 
 @app.route('/stream/<path:filepath>')
 def stream(filepath):
-    full_path = os.path.join(BASE_DIR, filepath)
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
+    full_path = safe_join(BASE_DIR, filepath)
+    st = _stat_or_none(full_path)
+    if st is None or not stat.S_ISREG(st.st_mode):
         return "File not found", 404
 
     def generate():
-        command = [
-            'C:\\ffmpeg-2025-11-17-git-e94439e49b-full_build\\bin\\ffmpeg.exe', '-i', full_path, '-c:v', 'libx264', '-c:a', 'aac',
-            '-preset', 'ultrafast', '-b:v', '500k', '-b:a', '96k', '-f', 'mp4', '-movflags', 'frag_keyframe', '-'
+        # 8-bit 4:2:0 so 10-bit (x265/HEVC) sources encode on hardware encoders and play in browsers
+        command = [FFMPEG_PATH, '-i', full_path] + _stream_video_args()[1] + [
+            '-pix_fmt', 'yuv420p', '-b:v', '500k', '-maxrate', '500k', '-bufsize', '1M', '-g', '60',
+            '-c:a', 'aac', '-b:a', '96k', '-f', 'mp4', '-movflags', 'frag_keyframe', '-'
         ]
-        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # stderr is discarded: an unread PIPE fills up with ffmpeg's progress output and stalls the encode
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        fd = proc.stdout.fileno()
         try:
             while True:
-                data = proc.stdout.read(1024*1024)  # 1MB chunks
+                data = os.read(fd, 1 << 20)  # up to 1MB per read, straight from the pipe
                 if not data:
                     break
                 yield data
         finally:
             proc.terminate()
 
-    return Response(generate(), content_type='video/mp4', headers={'Accept-Ranges': 'bytes'})
+    return Response(generate(), content_type='video/mp4', headers={'Accept-Ranges': 'bytes'}, direct_passthrough=True)
 
 @app.route('/thumb/<path:thumbpath>')
 def thumb(thumbpath):
     if thumbpath.endswith('/index.jpg'):
-        folder_path = os.path.join(BASE_DIR, thumbpath[:-len('/index.jpg')])
-        img_path = os.path.join(BASE_DIR, thumbpath)
-        if os.path.exists(img_path):
-            mime_type = mimetypes.guess_type(img_path)[0] or 'image/jpeg'
-            print("Thumbnail requested for:", thumbpath, "img_path:", img_path, "mime:", mime_type, "sending file")
-            try:
-                return send_file(img_path, mimetype=mime_type)
-            except Exception as e:
-                print("Error sending file:", img_path, "error:", e)
-                return '', 500
-        else:
-            print("Thumbnail requested for:", thumbpath, "img_path:", img_path, "not found")
+        img_path = safe_join(BASE_DIR, thumbpath)
+        if img_path is None:
+            logger.debug("thumb %s outside BASE_DIR", thumbpath)
+            return '', 404
+        mime_type = mimetypes.guess_type(img_path)[0] or 'image/jpeg'
+        logger.debug("thumb %s -> %s mime=%s", thumbpath, img_path, mime_type)
+        try:
+            # send_file adds ETag/Last-Modified and answers If-None-Match with 304
+            return send_file(img_path, mimetype=mime_type, max_age=THUMB_MAX_AGE)
+        except FileNotFoundError:
+            logger.debug("thumb %s -> %s not found", thumbpath, img_path)
             return '', 404
-    print("Thumbnail requested for:", thumbpath, "invalid path")
+        except Exception:
+            logger.exception("Error sending thumbnail %s", img_path)
+            return '', 500
+    logger.debug("thumb %s invalid path", thumbpath)
     return '', 404
 
 if __name__ == '__main__':
@@ -132,4 +235,5 @@ if __name__ == '__main__':
     print("TV Series Viewer Server")
     print(f"Access on this laptop: http://localhost:8000")
     print(f"Access from mobile/other devices: http://{local_ip}:8000")
+    print(f"Stream video encoder: {_stream_video_args()[0]}")
     app.run(host='0.0.0.0', port=8000, debug=True)
@@ -8,18 +8,34 @@ Notifies the user about placing index.jpg files in folder subdirectories.
 Usage:
     python generate_tv_thumbnails.py --target-dir "D:\TV\Detective,Thriller"
     python generate_tv_thumbnails.py --target-dir "D:\TV\Cartoon" --dry-run
+    python generate_tv_thumbnails.py --target-dir "D:\TV\Cartoon" --workers 16
+
+Requires requests and Pillow. Pillow-SIMD is a drop-in replacement for Pillow
+with faster resampling if it can be built on your machine.
 """
 
 import argparse
 import os
+import json
 import re
+import sqlite3
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
 from io import BytesIO
 import urllib.parse
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional, just a faster parser
+    _json_loads = json.loads
+
 
 # Folder filtering configuration
 SKIP_FOLDERS = [
@@ -27,6 +43,40 @@ SKIP_FOLDERS = [
     # Add more folders to skip below
 ]
 
+# Known shows whose spelling/casing TVMaze needs exactly, keyed by the lower-case
+# start of the cleaned title (so trailing years or 'Series 1-20' are ignored)
+KNOWN_SHOWS = {
+    'brooklyn nine-nine': 'Brooklyn Nine-Nine',
+    'brooklyn nine nine': 'Brooklyn Nine-Nine',
+    'midsomer murders': 'Midsomer Murders',
+    'byomkesh bakshi': 'Byomkesh Bakshi',
+    'death in paradise': 'Death in Paradise',
+    # Add more shows below
+}
+
+# Short titles that only count when they are the whole cleaned title
+KNOWN_SHOWS_EXACT = {
+    'castle': 'Castle',
+    'sherlock': 'Sherlock',
+    'suits': 'Suits',
+}
+
+# On-disk cache of TVMaze search responses, keyed by cleaned show name
+DEFAULT_CACHE_PATH = os.path.expanduser('~/.tv_thumbnails_cache.db')
+CACHE_TTL_DAYS = 30
+
+# Patterns used by clean_show_name, compiled once at import time
+# 'season' and sNN must end the word (Season1, S01 and S01E01 match; Seasoning, S0123 don't)
+_SEPARATOR_RE = re.compile(r'\s+(?:season(?![a-z])|s\d{2}(?:e\d+)*(?!\w)|1080p|720p|x26[45]|\(|\[|-\s)', re.IGNORECASE)
+_TRAILING_WORDS_RE = re.compile(r'(?:\s+(?:complete|series|collection|episodes?|seasons?))+\s*$', re.IGNORECASE)
+_WORD_OR_CONTRACTION_RE = re.compile(r"\w+(?:'\w+)*")
+_DOTS_UNDERSCORES_RE = re.compile(r'[._]+')
+_WHITESPACE_RE = re.compile(r'\s+')
+# Longest key first so the most specific known title wins
+_KNOWN_SHOW_PREFIX_RE = re.compile(
+    '^(?:' + '|'.join(re.escape(key) for key in sorted(KNOWN_SHOWS, key=len, reverse=True)) + r')(?!\w)'
+)
+
 def should_skip_folder(folder_name):
     """Check if folder should be skipped during thumbnail generation."""
     # Skip exact matches from SKIP_FOLDERS
@@ -38,50 +88,102 @@ def should_skip_folder(folder_name):
     return False
 
 class TVThumbnailGenerator:
-    def __init__(self, api_key, target_dir, dry_run=False, verbose=False, image_width=300):
+    def __init__(self, api_key, target_dir, dry_run=False, verbose=False, image_width=300, workers=8,
+                 cache_path=DEFAULT_CACHE_PATH, cache_ttl_days=CACHE_TTL_DAYS):
         self.api_key = api_key  # Not used for TVMaze
         self.target_dir = target_dir
         self.dry_run = dry_run
         self.verbose = verbose
         self.image_width = image_width
+        self.workers = max(1, workers)
         self.tvmaze_base_url = "https://api.tvmaze.com"
 
-        # Rate limiting: TMDB free tier allows ~50 requests per day
-        self.request_delay = 0.5  # 500ms between requests
+        # Shared session so the TVMaze API and image CDN connections are kept alive
+        # and reused across worker threads; transient errors and 429s are retried
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'tv_viewer/1.0'
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=max(32, self.workers),
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Rate limiting: TVMaze allows ~20 API calls per 10s per IP. The limit is
+        # global across worker threads and only applies to API searches; poster
+        # downloads come from the image CDN and run fully in parallel
+        self.request_delay = 0.5  # 500ms between API requests
+        self._rate_lock = threading.Lock()
+        self._next_request_time = 0.0
+        self._print_lock = threading.Lock()
+
+        # Search cache, shared by worker threads (sqlite3 connections need a lock for that)
+        self.cache_ttl = cache_ttl_days * 86400
+        self._cache_lock = threading.Lock()
+        self._cache = None
+        if cache_path and not dry_run:
+            try:
+                self._cache = sqlite3.connect(cache_path, check_same_thread=False)
+                self._cache.execute("CREATE TABLE IF NOT EXISTS shows(name TEXT PRIMARY KEY, json TEXT, ts INTEGER)")
+                self._cache.commit()
+            except sqlite3.Error as e:
+                # The cache is only a speed-up, so carry on without it
+                print(f"WARNING: Search cache '{cache_path}' unavailable, continuing without it: {e}")
+                self._cache = None
+
+    def _wait_for_rate_limit(self):
+        """Block until the next request slot is available (shared by all threads)."""
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request_time - now
+            self._next_request_time = max(now, self._next_request_time) + self.request_delay
+        if wait > 0:
+            time.sleep(wait)
+
+    def _cache_get(self, show_name):
+        """Return cached search results for show_name, or None if missing/expired."""
+        if self._cache is None:
+            return None
+        try:
+            with self._cache_lock:
+                row = self._cache.execute(
+                    "SELECT json FROM shows WHERE name = ? AND ts > ?",
+                    (show_name, int(time.time()) - self.cache_ttl)
+                ).fetchone()
+        except sqlite3.Error:
+            return None  # e.g. database locked by another run: treat as a miss
+        return _json_loads(row[0]) if row else None
+
+    def _cache_put(self, show_name, data):
+        """Store search results for show_name."""
+        if self._cache is None:
+            return
+        try:
+            with self._cache_lock:
+                self._cache.execute(
+                    "INSERT OR REPLACE INTO shows(name, json, ts) VALUES (?, ?, ?)",
+                    (show_name, json.dumps(data), int(time.time()))
+                )
+                self._cache.commit()
+        except sqlite3.Error:
+            pass  # skip the write; the result is still used for this run
 
     def clean_show_name(self, folder_name):
         """Clean folder name to extract meaningful TV show title."""
-        # Remove common patterns but keep structure
-        patterns_to_remove = [
-            r'\s*\(?\d{4}\)?(?:\s*\(?\d{4}\)?)*\s*$',  # Years at end like (2013) or 2013
-            r'season\s*\d+(?:-\d+)?(?:\s*s\d+(?:-\d+)?)*',  # Season info
-            r'\s*s\d+(?:-\d+)?(?:\s*-\s*\d+)?',  # S01-S08 patterns
-            r'\s*\d{3,4}p\s*',  # Resolution like 1080p, 720p
-            r'\s*web(?:-dl|\.dl)?\s*',  # WEB-DL, WEB
-            r'\s*x\d{3}\s*',  # x265, x264, etc.
-            r'\s*hevc\s*', r'\s*aac\s*', r'\s*eac3\s*', r'\s*dd\d+\.?\d*\s*',  # Audio codecs
-            r'\s*amzn\s*', r'\s*netflix\s*', r'\s*hbo\s*', r'\s*disney\+?\s*',  # Streaming services
-            r'\s*bluray\s*', r'\s*blu-ray\s*', r'\s*webrip\s*', r'\s*hdrip\s*', r'\s*dvdrip\s*',
-            r'\s*\[.*?\]\s*',  # Anything in brackets like [UTR], [BRSHNKV]
-            r'\s*-*$',  # Trailing dashes
-            r'\s*-\s*\d+$',  # Trailing -YYYY
-            r'.*$',  # Everything after certain patterns (be careful with this)
-        ]
-
         name = folder_name.strip()
         name = urllib.parse.unquote(name)  # Decode URL-encoded names
 
-        # Split on common separators and take the main title part
-        separators = [' season', ' s01', ' (', ' [', ' - ', ' 1080p', ' 720p', ' x265', ' x264']
-        main_title = name
+        # Release-style names like Breaking.Bad.S01.1080p use dots/underscores as spaces
+        if ' ' not in name:
+            name = _DOTS_UNDERSCORES_RE.sub(' ', name).strip()
 
-        for sep in separators:
-            if sep.lower() in name.lower():
-                main_title = name.split(sep.lower())[0].strip()
-                break
+        # Split at the first common separator and take the main title part
+        match = _SEPARATOR_RE.search(name)
+        main_title = name[:match.start()].strip() if match else name
 
         # Remove specific patterns that indicate non-title content
-        main_title = re.sub(r'\s+(complete|series|collection|episodes?|seasons?)\s*$', '', main_title, flags=re.IGNORECASE)
+        main_title = _TRAILING_WORDS_RE.sub('', main_title)
 
         # Handle specific known shows first
         lower_title = main_title.lower().strip()
@@ -94,49 +196,17 @@ class TVThumbnailGenerator:
             else:
                 return main_title.strip()
 
-        if 'brooklyn nine-nine' in lower_title or 'brooklyn nine nine' in lower_title:
-            return 'Brooklyn Nine-Nine'
-
-        if 'midsomer murders' in lower_title:
-            return 'Midsomer Murders'
-
-        if 'byomkesh bakshi' in lower_title:
-            return 'Byomkesh Bakshi'
-
-        if 'death in paradise' in lower_title:
-            return 'Death in Paradise'
-
-        # Generic title casing
-        if lower_title == 'castle':
-            return 'Castle'
-        if lower_title == 'sherlock':
-            return 'Sherlock'
-        if lower_title == 'suits':
-            return 'Suits'
-
-        # For complex cases, try to reconstruct proper title
-        words = re.findall(r'\b\w+\b', main_title)
-        if words:
-            # Capitalize each word, handling apostrophes
-            capitalized_words = []
-            for word in words:
-                if "'" in word:
-                    # Handle apostrophes: e.g., fisher's -> Fisher's
-                    parts = word.split("'")
-                    capitalized_word = parts[0][0].upper() + parts[0][1:].lower() + "'" + parts[1][0].upper() + parts[1][1:].lower()
-                    capitalized_words.append(capitalized_word)
-                elif len(word) <= 1:
-                    capitalized_words.append(word.upper())
-                else:
-                    capitalized_words.append(word[0].upper() + word[1:].lower())
-
-            result = ' '.join(capitalized_words)
-
-            # Clean up some common formatting issues
-            result = re.sub(r'\s+', ' ', result).strip()
-            return result
-
-        return main_title.strip()
+        known_title = KNOWN_SHOWS_EXACT.get(lower_title)
+        if known_title:
+            return known_title
+
+        match = _KNOWN_SHOW_PREFIX_RE.match(lower_title)
+        if match:
+            return KNOWN_SHOWS[match.group(0)]
+
+        # For complex cases, capitalize each word (keeping contractions like Fisher's intact)
+        result = _WORD_OR_CONTRACTION_RE.sub(lambda m: m.group(0).capitalize(), main_title)
+        return _WHITESPACE_RE.sub(' ', result).strip()
 
     def search_tvmaze_show(self, show_name):
         """Search TVMaze for a TV show and return the best match."""
@@ -155,36 +225,38 @@ class TVThumbnailGenerator:
         }
 
         try:
-            time.sleep(self.request_delay)  # Rate limiting
-            response = requests.get(search_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._cache_get(show_name)
+            if data is None:
+                self._wait_for_rate_limit()
+                response = self.session.get(search_url, params=params, timeout=10)
+                response.raise_for_status()
+                data = _json_loads(response.content)
+                # Only cache hits, so shows TVMaze doesn't list yet are retried next run
+                if data:
+                    self._cache_put(show_name, data)
 
             if not data:
                 return None, f"No results found for '{show_name}'"
 
             # Get the best match - prefer exact name matches, then highest rating
-            results = data
+            wanted_name = show_name.lower()
 
-            if not results:
-                return None, f"Empty results for '{show_name}'"
-
-            # Sort by: exact name match first, then rating
             def sort_key(result):
                 show = result.get('show', {})
-                name_match = show.get('name', '').lower() == show_name.lower()
+                name_match = show.get('name', '').lower() == wanted_name
                 rating = show.get('rating', {}).get('average', 0) or 0
                 return (name_match, rating)
 
             try:
-                results.sort(key=sort_key, reverse=True)
-                best_match = results[0]['show']
+                best_match = max(data, key=sort_key)['show']
                 return best_match, None
             except (KeyError, IndexError) as e:
                 return None, f"Failed to parse search results: {str(e)}"
 
         except requests.exceptions.RequestException as e:
             return None, f"API request failed: {str(e)}"
+        except ValueError as e:
+            return None, f"Invalid search response: {str(e)}"
 
     def download_and_resize_poster(self, poster_path, output_path):
         """Download poster image and resize to target width."""
@@ -195,13 +267,15 @@ class TVThumbnailGenerator:
         image_url = poster_path
 
         try:
-            time.sleep(self.request_delay)
-            response = requests.get(image_url, timeout=10)
+            response = self.session.get(image_url, timeout=10)
             response.raise_for_status()
 
             # Open image with PIL
             img = Image.open(BytesIO(response.content))
 
+            # For JPEGs let the decoder downscale (DCT scaling) close to the target size
+            img.draft('RGB', (self.image_width, self.image_width))
+
             # Convert to RGB if necessary (handles PNG with transparency)
             if img.mode in ('RGBA', 'LA', 'P'):
                 img = img.convert('RGB')
@@ -221,63 +295,75 @@ class TVThumbnailGenerator:
             return False, f"Image processing failed: {str(e)}"
 
     def process_show_folder(self, folder_path, folder_name):
-        """Process a single show folder."""
+        """Process a single show folder, printing its output as one block."""
+        # Folders run on worker threads, so collect the lines and print them
+        # together to keep each folder's messages next to each other
+        lines = []
+        try:
+            return self._process_show_folder(folder_path, folder_name, lines.append)
+        finally:
+            if lines:
+                with self._print_lock:
+                    print("\n".join(lines))
+
+    def _process_show_folder(self, folder_path, folder_name, log):
+        """Process a single show folder, reporting progress through log()."""
         # Skip folders based on user's defined rules
         if should_skip_folder(folder_name):
             if self.verbose:
-                print(f"  SKIPPED: '{folder_name}' (matches blacklist)")
+                log(f"  SKIPPED: '{folder_name}' (matches blacklist)")
             else:
-                print(f"  Skipped (blacklist): {folder_name[:40]}{'...' if len(folder_name) > 40 else ''}")
+                log(f"  Skipped (blacklist): {folder_name[:40]}{'...' if len(folder_name) > 40 else ''}")
             return "skipped_blacklist"
 
+        # Check if index.jpg already exists before doing any other work
+        index_path = os.path.join(folder_path, 'index.jpg')
+        if os.path.exists(index_path):
+            if self.verbose:
+                log(f"  Skipped: '{folder_name}' (index.jpg already exists)")
+            return "exists"
+
         show_name = self.clean_show_name(folder_name)
 
         if self.verbose:
-            print(f"  Processing: '{folder_name}' → '{show_name}'")
+            log(f"  Processing: '{folder_name}' → '{show_name}'")
         else:
-            print(f"  Processing: {folder_name[:50]}{'...' if len(folder_name) > 50 else ''}")
+            log(f"  Processing: {folder_name[:50]}{'...' if len(folder_name) > 50 else ''}")
 
         if self.dry_run:
-            print(f"    (DRY RUN) Would search for: '{show_name}'")
+            log(f"    (DRY RUN) Would search for: '{show_name}'")
             return "dry-run"
 
-        # Check if index.jpg already exists
-        index_path = os.path.join(folder_path, 'index.jpg')
-        if os.path.exists(index_path):
-            if self.verbose:
-                print(f"    Skipped: index.jpg already exists")
-            return "exists"
-
         # Search TVMaze
         show_data, error = self.search_tvmaze_show(show_name)
         if error:
-            print(f"    ERROR: {error}")
+            log(f"    ERROR: {error}")
             return "search_failed"
 
         if show_data is None:
-            print(f"    ERROR: No results found for '{show_name}'")
+            log(f"    ERROR: No results found for '{show_name}'")
             return "search_failed"
 
         try:
             poster_path = show_data.get('image', {}).get('medium')
         except AttributeError:
-            print(f"    ERROR: Invalid data structure for {show_name}")
+            log(f"    ERROR: Invalid data structure for {show_name}")
             return "search_failed"
 
         if not poster_path:
-            print(f"    ERROR: No poster available for {show_data.get('name', show_name)}")
+            log(f"    ERROR: No poster available for {show_data.get('name', show_name)}")
             return "no_poster"
 
         if self.verbose:
-            print(f"    Found: {show_data.get('name')} ({show_data.get('premiered', 'Unknown year')[:4]})")
+            log(f"    Found: {show_data.get('name')} ({show_data.get('premiered', 'Unknown year')[:4]})")
 
         # Download and resize
         success, msg = self.download_and_resize_poster(poster_path, index_path)
         if success:
-            print(f"    SUCCESS: {msg}")
+            log(f"    SUCCESS: {msg}")
             return "success"
         else:
-            print(f"    ERROR: {msg}")
+            log(f"    ERROR: {msg}")
             return "download_failed"
 
     def run(self):
@@ -286,6 +372,7 @@ class TVThumbnailGenerator:
         print(f"Target directory: {self.target_dir}")
         print(f"Image width: {self.image_width}px")
         print(f"Dry run: {'YES' if self.dry_run else 'NO'}")
+        print(f"Workers: {self.workers}")
         print("-" * 50)
 
         if not os.path.exists(self.target_dir):
@@ -307,13 +394,17 @@ class TVThumbnailGenerator:
             print("No folders found in target directory")
             sys.exit(0)
 
-        print(f"Found {len(folders)} folders to process")
+        # Folders that already have a thumbnail never need to reach the workers
+        todo = [(folder_path, folder_name) for folder_path, folder_name in folders
+                if not os.path.exists(os.path.join(folder_path, 'index.jpg'))]
+
+        print(f"Found {len(folders)} folders, {len(todo)} without index.jpg to process")
         print()
 
         # Process each folder
         stats = {
             'success': 0,
-            'exists': 0,
+            'exists': len(folders) - len(todo),
             'skipped_blacklist': 0,
             'search_failed': 0,
             'no_poster': 0,
@@ -321,9 +412,16 @@ class TVThumbnailGenerator:
             'dry-run': 0
         }
 
-        for folder_path, folder_name in folders:
-            result = self.process_show_folder(folder_path, folder_name)
-            stats[result] += 1
+        # Process folders concurrently - each one is dominated by network round-trips
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.process_show_folder, folder_path, folder_name)
+                       for folder_path, folder_name in todo]
+            for future in as_completed(futures):
+                stats[future.result()] += 1
+
+        self.session.close()
+        if self._cache is not None:
+            self._cache.close()
 
         print("\n" + "=" * 50)
         print("SUMMARY:")
@@ -344,6 +442,9 @@ def main():
     parser.add_argument('--image-width', type=int, default=300, help='Thumbnail width in pixels (default: 300)')
     parser.add_argument('--dry-run', action='store_true', help='Test mode - don\'t actually download images')
     parser.add_argument('--verbose', action='store_true', help='Verbose output')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_PATH, help=f'TVMaze search cache database (default: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--no-cache', action='store_true', help='Don\'t read or write the TVMaze search cache')
+    parser.add_argument('--workers', type=int, default=8, help='Number of folders processed in parallel (default: 8)')
 
     args = parser.parse_args()
 
@@ -352,7 +453,9 @@ def main():
         target_dir=args.target_dir,
         dry_run=args.dry_run,
         verbose=args.verbose,
-        image_width=args.image_width
+        image_width=args.image_width,
+        workers=args.workers,
+        cache_path=None if args.no_cache else args.cache_file
     )
 
     generator.run()